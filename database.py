@@ -5,11 +5,12 @@ MongoDB helper functions ready to use in your backend code.
 Import and use these functions in your API endpoints for database operations.
 """
 
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import BulkWriteError
 from datetime import datetime, timezone
 import os
 from dotenv import load_dotenv
-from typing import Union
+from typing import List, Union
 from pydantic import BaseModel
 
 # Load environment variables from .env file
@@ -22,12 +23,21 @@ database_url = os.getenv("DATABASE_URL")
 database_name = os.getenv("DATABASE_NAME")
 
 if database_url and database_name:
-    _client = MongoClient(database_url)
+    # tz_aware so stored BSON dates come back as UTC-aware datetimes. This is
+    # API-visible: created_at/expires_at are serialized with a UTC offset ("Z")
+    # instead of the previous naive, offset-less timestamps.
+    _client = AsyncIOMotorClient(
+        database_url,
+        tz_aware=True,
+        minPoolSize=10,
+        maxPoolSize=50,
+        serverSelectionTimeoutMS=3000,
+    )
     db = _client[database_name]
 
 # Helper functions for common database operations
-def create_document(collection_name: str, data: Union[BaseModel, dict]):
-    """Insert a single document with timestamp"""
+async def create_document(collection_name: str, data: Union[BaseModel, dict]):
+    """Insert a single document with timestamp (keeps a caller-supplied created_at)"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
 
@@ -37,19 +47,51 @@ def create_document(collection_name: str, data: Union[BaseModel, dict]):
     else:
         data_dict = data.copy()
 
-    data_dict['created_at'] = datetime.now(timezone.utc)
-    data_dict['updated_at'] = datetime.now(timezone.utc)
+    now = datetime.now(timezone.utc)
+    data_dict.setdefault('created_at', now)
+    data_dict['updated_at'] = now
 
-    result = db[collection_name].insert_one(data_dict)
+    result = await db[collection_name].insert_one(data_dict)
     return str(result.inserted_id)
 
-def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None):
-    """Get documents from collection"""
+async def create_documents(collection_name: str, data_list: List[Union[BaseModel, dict]]):
+    """Insert many documents with timestamps in a single unordered round-trip.
+
+    Returns (ids, errors): ids is aligned with data_list and holds None for
+    documents that failed; errors lists {"index", "message"} for each failure.
+    """
+    if db is None:
+        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+
+    now = datetime.now(timezone.utc)
+    docs = []
+    for data in data_list:
+        data_dict = data.model_dump() if isinstance(data, BaseModel) else data.copy()
+        data_dict.setdefault('created_at', now)
+        data_dict['updated_at'] = now
+        docs.append(data_dict)
+
+    # insert_many assigns each doc its _id client-side, so on a partial failure
+    # the ids of the docs that did land are still known
+    try:
+        await db[collection_name].insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        errors = [
+            {"index": err["index"], "message": err.get("errmsg", "")}
+            for err in e.details.get("writeErrors", [])
+        ]
+        failed = {err["index"] for err in errors}
+        ids = [None if i in failed else str(d["_id"]) for i, d in enumerate(docs)]
+        return ids, errors
+    return [str(d["_id"]) for d in docs], []
+
+async def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None, projection: dict = None):
+    """Get documents from collection, optionally restricted to the projected fields"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
     
-    cursor = db[collection_name].find(filter_dict or {})
+    cursor = db[collection_name].find(filter_dict or {}, projection=projection)
     if limit:
         cursor = cursor.limit(limit)
     
-    return list(cursor)
+    return await cursor.to_list(length=None)
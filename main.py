@@ -1,16 +1,24 @@
+import base64
+import logging
 import os
-import secrets
+import time
 from datetime import datetime, timedelta, timezone
-from typing import List, Optional
+from typing import List, Optional, Tuple
 
-from fastapi import FastAPI, HTTPException
+import orjson
+
+from fastapi import Depends, FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel, Field
 from bson import ObjectId
+from cachetools import TTLCache
+
+from database import db, create_document, create_documents, get_documents
 
-from database import db, create_document, get_documents
+logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Digital Products Store API")
+app = FastAPI(title="Digital Products Store API", default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -33,22 +41,32 @@ class PyObjectId(ObjectId):
     def validate(cls, v):
         if isinstance(v, ObjectId):
             return v
-        try:
-            return ObjectId(str(v))
-        except Exception:
-            raise ValueError("Invalid ObjectId")
+        if isinstance(v, str) and len(v) == 24:
+            try:
+                return ObjectId(v)
+            except Exception:
+                pass
+        raise ValueError("Invalid ObjectId")
 
-def serialize_doc(doc: dict) -> dict:
-    if not doc:
-        return doc
-    doc = dict(doc)
-    if doc.get("_id"):
-        doc["id"] = str(doc.pop("_id"))
-    # convert datetimes to isoformat
-    for k, v in list(doc.items()):
-        if isinstance(v, datetime):
-            doc[k] = v.isoformat()
-    return doc
+# token -> (download response, expires_at as epoch seconds). Only touched from
+# the event loop with no await in between, so no lock is needed.
+_download_cache: TTLCache = TTLCache(maxsize=10_000, ttl=300)
+
+async def request_now() -> datetime:
+    """Single UTC "now" shared by everything in one request."""
+    return datetime.now(timezone.utc)
+
+def serialize_product(d: dict) -> dict:
+    # Fixed field list; datetimes are left as-is since orjson serializes them natively
+    return {
+        "id": str(d["_id"]),
+        "title": d["title"],
+        "description": d.get("description"),
+        "price": d["price"],
+        "thumbnail_url": d.get("thumbnail_url"),
+        "file_url": d.get("file_url"),
+        "created_at": d.get("created_at"),
+    }
 
 
 # ----------------------
@@ -68,6 +86,16 @@ class Product(ProductIn):
     id: str
     created_at: Optional[datetime] = None
 
+# Fields needed to build a Product response (skips updated_at and anything extra)
+PRODUCT_PROJECTION = {
+    "title": 1,
+    "description": 1,
+    "price": 1,
+    "thumbnail_url": 1,
+    "file_url": 1,
+    "created_at": 1,
+}
+
 class CartItem(BaseModel):
     product_id: str
     quantity: int = Field(1, ge=1, le=50)
@@ -92,45 +120,127 @@ class Order(BaseModel):
     download_links: List[DownloadLink]
     created_at: datetime
 
+class BulkWriteFailure(BaseModel):
+    index: int
+    message: str
+
+class BulkOrderInserted(BaseModel):
+    index: int
+    order: Order
+
+class BulkOrdersPartial(BaseModel):
+    """207 body when only some orders in a bulk request were written."""
+    inserted: List[BulkOrderInserted]
+    failed: List[BulkWriteFailure]
+
+
+# ----------------------
+# Startup
+# ----------------------
+@app.on_event("startup")
+async def warmup():
+    if db is None:
+        return
+    # Pay the connect/auth handshake at boot instead of on the first request.
+    # A failure here must not stop the service; /test reports the DB state.
+    try:
+        await db.command("ping")
+    except Exception as e:
+        logger.warning("MongoDB warmup ping failed: %s", e)
+
+
+@app.on_event("startup")
+async def ensure_indexes():
+    if db is None:
+        return
+    # Download tokens come from 24 bytes of os.urandom (192 bits), so they are
+    # effectively unique; the unique multikey index turns token resolution into
+    # an IXSCAN and rejects any accidental collision. The partial filter leaves
+    # empty-cart orders (no tokens) out of the index, so they don't collide on null.
+    try:
+        await db["order"].create_index(
+            "download_links.token",
+            unique=True,
+            partialFilterExpression={"download_links.token": {"$exists": True}},
+        )
+    except Exception as e:
+        logger.warning("Could not create download token index: %s", e)
+
 
 # ----------------------
 # Routes
 # ----------------------
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "Digital Products Store Backend running"}
 
 
 # Products
+# (monotonic timestamp, serialized catalog JSON); cleared when a product is created
+_products_cache: Optional[Tuple[float, bytes]] = None
+# Bumped on every create so an in-flight list_products can't re-cache a stale catalog
+_products_generation = 0
+PRODUCTS_CACHE_TTL = 5.0
+
+# Responses are raw bytes, so response_model here only documents the schema
 @app.get("/api/products", response_model=List[Product])
-def list_products():
-    docs = get_documents("product", {}, limit=None)
-    products: List[Product] = []
-    for d in docs:
-        products.append(Product(**serialize_doc(d)))
-    return products
+async def list_products():
+    global _products_cache
+    cached = _products_cache
+    if cached is not None and time.monotonic() - cached[0] < PRODUCTS_CACHE_TTL:
+        return Response(content=cached[1], media_type="application/json")
+
+    generation = _products_generation
+    docs = await get_documents("product", {}, limit=None, projection=PRODUCT_PROJECTION)
+    # Catalog docs come from our own writes, so serialize them without validation
+    content = orjson.dumps([serialize_product(d) for d in docs], option=orjson.OPT_UTC_Z)
+    if generation == _products_generation:
+        _products_cache = (time.monotonic(), content)
+    return Response(content=content, media_type="application/json")
 
 
 @app.post("/api/products", response_model=Product)
-def create_product(product: ProductIn):
+async def create_product(product: ProductIn):
+    global _products_cache, _products_generation
     data = product.model_dump()
-    new_id = create_document("product", data)
-    created = db["product"].find_one({"_id": ObjectId(new_id)})
-    return Product(**serialize_doc(created))
+    new_id = await create_document("product", data)
+    _products_generation += 1
+    _products_cache = None
+    created = await db["product"].find_one({"_id": ObjectId(new_id)})
+    return Product(**serialize_product(created))
 
 
 # Orders
-@app.post("/api/orders", response_model=Order)
-def create_order(payload: OrderIn):
+# Upper bound on items accepted by the bulk endpoints
+MAX_BULK_ITEMS = 100
+
+async def _load_products(payloads: List[OrderIn]):
+    """Validate product ids across all payloads and fetch their prices in one query."""
+    # Validate each distinct product_id once, even if it repeats in the cart
+    oids = {}
+    for payload in payloads:
+        for item in payload.items:
+            if item.product_id not in oids:
+                try:
+                    oids[item.product_id] = PyObjectId.validate(item.product_id)
+                except ValueError:
+                    raise HTTPException(status_code=400, detail=f"Invalid product_id: {item.product_id}")
+    # Single round-trip for every cart instead of one find_one per item
+    cursor = db["product"].find({"_id": {"$in": list(oids.values())}}, projection={"price": 1})
+    # Prices are stored in rupees; totals are summed in integer paise
+    prices = {p["_id"]: int(round(p.get("price", 0) * 100)) async for p in cursor}
+    return oids, prices
+
+
+def _build_order_doc(payload: OrderIn, oids: dict, prices: dict, now: datetime) -> dict:
     # Validate products and compute total
-    total = 0.0
+    total_paise = 0
     validated_items: List[CartItem] = []
     for item in payload.items:
-        prod = db["product"].find_one({"_id": PyObjectId.validate(item.product_id)})
-        if not prod:
+        oid = oids[item.product_id]
+        if oid not in prices:
             raise HTTPException(status_code=404, detail=f"Product not found: {item.product_id}")
-        price = float(prod.get("price", 0))
-        total += price * item.quantity
+        total_paise += prices[oid] * item.quantity
         validated_items.append(item)
 
     # Simulate instant payment success for demo
@@ -138,48 +248,110 @@ def create_order(payload: OrderIn):
 
     # Generate secure download tokens per product
     download_links = []
-    expires_at = datetime.now(timezone.utc) + timedelta(days=7)
-    for item in validated_items:
-        token = secrets.token_urlsafe(24)
+    expires_at = now + timedelta(days=7)
+    # One CSPRNG read for the whole order, sliced into 24-byte urlsafe tokens
+    n = len(validated_items)
+    raw = os.urandom(24 * n)
+    tokens = [
+        base64.urlsafe_b64encode(raw[i * 24:(i + 1) * 24]).rstrip(b"=").decode("ascii")
+        for i in range(n)
+    ]
+    for item, token in zip(validated_items, tokens):
         download_links.append({
             "product_id": item.product_id,
             "token": token,
             "expires_at": expires_at,
         })
 
-    order_doc = {
+    return {
         "status": status,
-        "amount": round(total, 2),
+        "amount_paise": total_paise,
         "items": [i.model_dump() for i in validated_items],
         "customer_name": payload.customer_name,
         "customer_email": payload.customer_email,
         "download_links": download_links,
+        "created_at": now,
     }
 
-    new_id = create_document("order", order_doc)
-    saved = db["order"].find_one({"_id": ObjectId(new_id)})
-    return Order(id=str(saved["_id"]),
-                 status=saved["status"],
-                 amount=float(saved["amount"]),
-                 items=[CartItem(**i) for i in saved["items"]],
-                 customer_name=saved["customer_name"],
-                 customer_email=saved["customer_email"],
-                 download_links=[DownloadLink(
-                     product_id=dl["product_id"],
-                     token=dl["token"],
-                     expires_at=dl["expires_at"],
-                 ) for dl in saved["download_links"]],
-                 created_at=saved.get("created_at", datetime.now(timezone.utc)))
+
+def _order_response(order_id: str, payload: OrderIn, order_doc: dict) -> Order:
+    # Built from the in-memory doc, so no find_one round-trip after the insert.
+    # model_construct skips input validation; create_order also bypasses
+    # response_model so the result isn't re-validated on the way out.
+    return Order.model_construct(
+        id=order_id,
+        status=order_doc["status"],
+        amount=order_doc["amount_paise"] / 100,
+        items=payload.items,
+        customer_name=order_doc["customer_name"],
+        customer_email=order_doc["customer_email"],
+        download_links=[DownloadLink.model_construct(**dl) for dl in order_doc["download_links"]],
+        created_at=order_doc["created_at"],
+    )
+
+
+# response_model=None skips FastAPI's re-validation of the server-built order;
+# the Order schema is still documented through responses=
+@app.post("/api/orders", response_model=None, responses={200: {"model": Order}})
+async def create_order(payload: OrderIn, now: datetime = Depends(request_now)):
+    oids, prices = await _load_products([payload])
+    order_doc = _build_order_doc(payload, oids, prices, now)
+    new_id = await create_document("order", order_doc)
+    order = _order_response(new_id, payload, order_doc)
+    return ORJSONResponse(content=order.model_dump(mode="json"))
+
+
+def _check_batch_size(batch: list):
+    if len(batch) > MAX_BULK_ITEMS:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Batch too large: at most {MAX_BULK_ITEMS} items per request",
+        )
+
+
+@app.post(
+    "/api/orders/bulk",
+    response_model=List[Order],
+    responses={207: {"model": BulkOrdersPartial, "description": "Some orders failed to insert"}},
+)
+async def create_orders_bulk(payloads: List[OrderIn], now: datetime = Depends(request_now)):
+    _check_batch_size(payloads)
+    if not payloads:
+        return []
+    oids, prices = await _load_products(payloads)
+    order_docs = [_build_order_doc(p, oids, prices, now) for p in payloads]
+    new_ids, errors = await create_documents("order", order_docs)
+    orders = [
+        _order_response(i, p, d) if i is not None else None
+        for i, p, d in zip(new_ids, payloads, order_docs)
+    ]
+    if errors:
+        # Some orders were written: report them so a retry doesn't duplicate them
+        return ORJSONResponse(status_code=207, content={
+            "inserted": [
+                {"index": idx, "order": o.model_dump(mode="json")}
+                for idx, o in enumerate(orders) if o is not None
+            ],
+            "failed": errors,
+        })
+    return orders
+
+
+def _order_amount(doc: dict) -> float:
+    # Orders created before amount_paise existed stored a float "amount"
+    if "amount_paise" in doc:
+        return doc["amount_paise"] / 100
+    return doc["amount"]
 
 
 @app.get("/api/orders/{order_id}", response_model=Order)
-def get_order(order_id: str):
-    doc = db["order"].find_one({"_id": PyObjectId.validate(order_id)})
+async def get_order(order_id: str, now: datetime = Depends(request_now)):
+    doc = await db["order"].find_one({"_id": PyObjectId.validate(order_id)})
     if not doc:
         raise HTTPException(status_code=404, detail="Order not found")
     return Order(id=str(doc["_id"]),
                  status=doc["status"],
-                 amount=float(doc["amount"]),
+                 amount=_order_amount(doc),
                  items=[CartItem(**i) for i in doc["items"]],
                  customer_name=doc["customer_name"],
                  customer_email=doc["customer_email"],
@@ -188,47 +360,56 @@ def get_order(order_id: str):
                      token=dl["token"],
                      expires_at=dl["expires_at"],
                  ) for dl in doc["download_links"]],
-                 created_at=doc.get("created_at", datetime.now(timezone.utc)))
+                 created_at=doc.get("created_at", now))
 
 
 @app.get("/api/download/{token}")
-def resolve_download(token: str):
-    order = db["order"].find_one({"download_links.token": token})
+async def resolve_download(token: str, now: datetime = Depends(request_now)):
+    cached = _download_cache.get(token)
+    if cached is not None:
+        result, expires_ts = cached
+        if expires_ts <= now.timestamp():
+            _download_cache.pop(token, None)
+            raise HTTPException(status_code=410, detail="Link expired")
+        return result
+
+    # Positional projection returns only the link that matched the token
+    order = await db["order"].find_one(
+        {"download_links.token": token},
+        projection={"download_links.$": 1},
+    )
     if not order:
         raise HTTPException(status_code=404, detail="Invalid token")
+    link = order["download_links"][0]
 
-    # Find the specific link
-    link = None
-    for dl in order.get("download_links", []):
-        if dl.get("token") == token:
-            link = dl
-            break
-    if not link:
-        raise HTTPException(status_code=404, detail="Download not found")
-
-    # Check expiry
-    expires_at = link.get("expires_at")
-    if isinstance(expires_at, str):
-        try:
-            expires_at = datetime.fromisoformat(expires_at)
-        except Exception:
-            pass
-    if expires_at and datetime.now(timezone.utc) > expires_at.replace(tzinfo=timezone.utc):
+    # Check expiry (stored as a native BSON date, read back tz-aware)
+    expires_at = link["expires_at"]
+    if expires_at <= now:
         raise HTTPException(status_code=410, detail="Link expired")
 
     # Resolve product file URL
-    prod = db["product"].find_one({"_id": PyObjectId.validate(link["product_id"])})
+    prod = await db["product"].find_one(
+        {"_id": PyObjectId.validate(link["product_id"])},
+        projection={"file_url": 1, "title": 1, "thumbnail_url": 1},
+    )
     if not prod:
         raise HTTPException(status_code=404, detail="Product not found")
     file_url = prod.get("file_url")
     if not file_url:
         raise HTTPException(status_code=404, detail="File not available for this product")
 
-    return {
-        "product": serialize_doc(prod),
+    result = {
+        "product": {
+            "id": str(prod["_id"]),
+            "title": prod.get("title"),
+            "thumbnail_url": prod.get("thumbnail_url"),
+            "file_url": file_url,
+        },
         "file_url": file_url,
         "message": "Direct your client to this URL to download the file. In production, stream the file from secure storage.",
     }
+    _download_cache[token] = (result, expires_at.timestamp())
+    return result
 
 
 # Demo lead capture to simulate DM/contact
@@ -239,13 +420,41 @@ class DemoLead(BaseModel):
     message: Optional[str] = None
 
 @app.post("/api/demo-lead")
-def demo_lead(lead: DemoLead):
-    create_document("lead", lead.model_dump())
+async def demo_lead(lead: DemoLead):
+    await create_document("lead", lead.model_dump())
     return {"status": "ok", "message": "We will contact you in 15 minutes."}
 
 
-@app.get("/test")
-def test_database():
+@app.post("/api/demo-leads/bulk")
+async def demo_leads_bulk(leads: List[DemoLead]):
+    _check_batch_size(leads)
+    if not leads:
+        return {"status": "ok", "inserted": 0}
+    new_ids, errors = await create_documents("lead", [lead.model_dump() for lead in leads])
+    if errors:
+        return ORJSONResponse(status_code=207, content={
+            "status": "partial",
+            "inserted": [{"index": idx, "id": i} for idx, i in enumerate(new_ids) if i is not None],
+            "failed": errors,
+        })
+    return {"status": "ok", "inserted": len(new_ids)}
+
+
+# Health checks hit /test often; listCollections is a real server round-trip
+_collections_cache: TTLCache = TTLCache(maxsize=1, ttl=30)
+
+# Diagnostics route is off unless ENABLE_TEST_ENDPOINT=1 (start_server.sh sets it for dev)
+ENABLE_TEST_ENDPOINT = os.getenv("ENABLE_TEST_ENDPOINT", "0").lower() in ("1", "true", "yes")
+
+async def _cached_collections() -> List[str]:
+    collections = _collections_cache.get("names")
+    if collections is None:
+        collections = await db.list_collection_names()
+        _collections_cache["names"] = collections
+    return collections
+
+
+async def test_database():
     response = {
         "backend": "✅ Running",
         "database": "❌ Not Available",
@@ -263,7 +472,7 @@ def test_database():
             response["connection_status"] = "Connected"
 
             try:
-                collections = db.list_collection_names()
+                collections = await _cached_collections()
                 response["collections"] = collections[:10]
                 response["database"] = "✅ Connected & Working"
             except Exception as e:
@@ -281,6 +490,11 @@ def test_database():
     return response
 
 
+# Registered only when enabled so /test doesn't appear in the OpenAPI schema otherwise
+if ENABLE_TEST_ENDPOINT:
+    app.get("/test")(test_database)
+
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
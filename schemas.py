@@ -12,7 +12,7 @@ class Product(BaseModel):
 
 class Order(BaseModel):
     status: str = Field(..., description="Order status e.g., paid, failed, pending")
-    amount: float = Field(..., ge=0, description="Total amount")
+    amount_paise: int = Field(..., ge=0, description="Total amount in paise (INR x 100)")
     items: List[dict] = Field(default_factory=list, description="Cart items with product_id and quantity")
     customer_name: str = Field(...)
     customer_email: str = Field(...)